@@ -1,15 +1,38 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.server_api import ServerApi
+from cachetools import TTLCache, cached
+import orjson
 import pandas as pd
 import os
+import re
+import threading
+from functools import lru_cache
 import urllib.parse
 from dotenv import load_dotenv
 
 # --- 1. SETUP & SECURITY ---
 load_dotenv()
 
+# jsonify goes through orjson's C encoder instead of the stdlib json module
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            mimetype="application/json"
+        )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # MongoDB Configuration
@@ -26,28 +49,66 @@ escaped_password = urllib.parse.quote_plus(password)
 connection_string = (
     f"mongodb+srv://{escaped_username}:{escaped_password}@{cluster}/"
     "?retryWrites=true&w=majority"
+    "&compressors=zstd,snappy,zlib&zlibCompressionLevel=6"
+    "&maxPoolSize=50&minPoolSize=5"
 )
 
 # Database Connection
-try:
-    client = MongoClient(
+# Also used by gunicorn.conf.py to give each forked worker its own client
+def create_client():
+    return MongoClient(
         connection_string,
+        server_api=ServerApi("1", strict=False),
         tlsAllowInvalidCertificates=True,
         serverSelectionTimeoutMS=5000
     )
+
+try:
+    client = create_client()
     db = client["wildlife_db"]
     client.admin.command("ping")
+    # Warm the pool before traffic arrives
+    db.features.find_one({}, {"_id": 1})
     print("✅ Connected to MongoDB Atlas!")
 except Exception as e:
     print(f"❌ Database connection failed: {e}")
     exit()
 
-# --- 2. PRE-CALCULATE GLOBAL MEANS ---
+# --- 2. NORMALIZED TAXON FIELD & INDEXES ---
+# Case-insensitive regex filters cannot use an index, so every collection
+# carries a lowercase copy of Taxon that exact-match lookups can seek on.
+# Loaders must set Taxon_lc on write (see README); startup repairs any document
+# where it is missing or no longer matches Taxon.
 try:
-    all_features = list(db.features.find({}, {"_id": 0}))
-    if all_features:
-        df_global = pd.DataFrame(all_features)
-        GLOBAL_MEANS = df_global.mean(numeric_only=True).to_dict()
+    for collection in (db.predictions, db.features):
+        collection.update_many(
+            {"$expr": {"$ne": ["$Taxon_lc", {"$toLower": "$Taxon"}]}},
+            [{"$set": {"Taxon_lc": {"$toLower": "$Taxon"}}}]
+        )
+    db.predictions.create_index([("Taxon_lc", 1)])
+    # Compound index also covers Taxon_lc-only lookups via its prefix
+    db.features.create_index([("Taxon_lc", 1), ("Exporter", 1)])
+    print("✅ Taxon indexes ready.")
+except Exception as e:
+    print(f"❌ Index setup error: {e}")
+
+# --- 3. PRE-CALCULATE GLOBAL MEANS ---
+# Averages are computed server-side so only a handful of floats cross the wire.
+MEAN_FIELDS = (
+    "export_qty_log",
+    "num_trade_events",
+    "source_risk",
+    "live_trade_ratio",
+    "appendix_risk",
+)
+
+try:
+    means = next(db.features.aggregate([
+        {"$group": {"_id": None, **{k: {"$avg": f"${k}"} for k in MEAN_FIELDS}}}
+    ]), None)
+    if means:
+        means.pop("_id", None)
+        GLOBAL_MEANS = {k: v for k, v in means.items() if v is not None}
         print("✅ Global means calculated.")
     else:
         GLOBAL_MEANS = {}
@@ -56,7 +117,13 @@ except Exception as e:
     print(f"❌ Mean calculation error: {e}")
     GLOBAL_MEANS = {}
 
-# --- 3. STATIC SPECIES FACTS (normalized to lowercase keys) ---
+# Thresholds unpacked once so explain_risk compares against plain floats
+MEAN_EXPORT, MEAN_EVENTS, MEAN_SOURCE, MEAN_LIVE = (
+    GLOBAL_MEANS.get(k, 0)
+    for k in ("export_qty_log", "num_trade_events", "source_risk", "live_trade_ratio")
+)
+
+# --- 4. STATIC SPECIES FACTS (normalized to lowercase keys) ---
 SPECIES_FACTS = {
     "alligator mississippiensis": {
         "common_name": "American Alligator",
@@ -84,23 +151,23 @@ SPECIES_FACTS = {
     }
 }
 
-# --- 4. HELPER FUNCTION ---
-def explain_risk(profile, means):
+# --- 5. HELPER FUNCTIONS ---
+def explain_risk(profile):
     if not profile:
         return ""
 
     reasons = []
 
-    if profile.get("export_qty_log", 0) > means.get("export_qty_log", 0):
+    if profile.get("export_qty_log", 0) > MEAN_EXPORT:
         reasons.append("higher-than-average export volume")
 
-    if profile.get("num_trade_events", 0) > means.get("num_trade_events", 0):
+    if profile.get("num_trade_events", 0) > MEAN_EVENTS:
         reasons.append("frequent export transactions")
 
-    if profile.get("source_risk", 0) > means.get("source_risk", 0):
+    if profile.get("source_risk", 0) > MEAN_SOURCE:
         reasons.append("predominantly wild-sourced specimens")
 
-    if profile.get("live_trade_ratio", 0) > means.get("live_trade_ratio", 0):
+    if profile.get("live_trade_ratio", 0) > MEAN_LIVE:
         reasons.append("significant live animal trade")
 
     if profile.get("appendix_risk", 0) >= 2:
@@ -111,24 +178,87 @@ def explain_risk(profile, means):
 
     return "Risk is elevated due to " + ", ".join(reasons) + "."
 
-# --- 5. API ROUTES ---
-
-@app.route("/get_animal_data", methods=["GET"])
-def get_animal_data():
-    taxon = request.args.get("taxon")
-    if not taxon:
-        return jsonify({"error": "No taxon provided"}), 400
-
-    taxon_clean = taxon.strip().lower()
-
-    # Prediction lookup
-    prediction = db.predictions.find_one(
-        {"Taxon": {"$regex": f"^{taxon}$", "$options": "i"}},
-        {"_id": 0}
-    )
-
-    if not prediction:
-        return jsonify({"error": "Species not found"}), 404
+# Only the columns the heatmap and explain_risk read are pulled from features
+HEATMAP_PROJECTION = {"_id": 0, "Exporter": 1, **{k: 1 for k in MEAN_FIELDS}}
+
+# Explanations only depend on stored data and the global means, so they are
+# written back onto each prediction once per startup rather than per request
+def cache_risk_explanations():
+    # Each prediction joined with its likely-country profile in one round trip
+    predictions = db.predictions.aggregate([
+        {"$lookup": {
+            "from": "features",
+            "let": {
+                "taxon": "$Taxon_lc",
+                "country": "$likely_poaching_country"
+            },
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$Taxon_lc", "$$taxon"]},
+                    {"$eq": ["$Exporter", "$$country"]}
+                ]}}},
+                {"$limit": 1},
+                {"$project": HEATMAP_PROJECTION}
+            ],
+            "as": "profile"
+        }},
+        {"$project": {"risk_explanation_cached": 1, "profile": 1}}
+    ], batchSize=1000)
+
+    # Only write back explanations whose text actually changed, flushing in
+    # batches so memory stays bounded regardless of collection size
+    updates = []
+    updated = 0
+    for prediction in predictions:
+        profile = prediction["profile"][0] if prediction["profile"] else None
+        text = explain_risk(profile)
+        if prediction.get("risk_explanation_cached") != text:
+            updates.append(UpdateOne(
+                {"_id": prediction["_id"]},
+                {"$set": {"risk_explanation_cached": text}}
+            ))
+        if len(updates) >= 1000:
+            db.predictions.bulk_write(updates, ordered=False)
+            updated += len(updates)
+            updates = []
+    if updates:
+        db.predictions.bulk_write(updates, ordered=False)
+        updated += len(updates)
+    return updated
+
+# Taxon names are plain words; anything else is rejected before it reaches
+# the caches or the database
+TAXON_PATTERN = re.compile(r"[A-Za-z .'-]{1,64}")
+
+# Hot taxa hit this repeatedly, so the normalized string is reused
+@lru_cache(maxsize=64)
+def _normalize_taxon(taxon):
+    return taxon.strip().lower()
+
+# Per-taxon payloads are memoized so repeat lookups skip Mongo entirely;
+# the TTL bounds how long an updated prediction can be served stale, and the
+# lock keeps the cache consistent under the threaded dev server.
+@cached(TTLCache(maxsize=512, ttl=600), lock=threading.Lock())
+def load_animal_data(taxon_clean):
+    # Prediction joined with its feature rows in a single round trip
+    results = list(db.predictions.aggregate([
+        {"$match": {"Taxon_lc": taxon_clean}},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "features",
+            "localField": "Taxon_lc",
+            "foreignField": "Taxon_lc",
+            "pipeline": [{"$project": HEATMAP_PROJECTION}],
+            "as": "heatmap_data"
+        }},
+        {"$project": {"_id": 0, "Taxon_lc": 0}}
+    ]))
+
+    if not results:
+        return None
+
+    prediction = results[0]
+    features = prediction.pop("heatmap_data")
 
     # Species facts
     facts = SPECIES_FACTS.get(taxon_clean)
@@ -138,34 +268,71 @@ def get_animal_data():
         else "Demand-driven international trade pressure detected. "
     )
 
-    # Feature data for heatmap
-    features = list(db.features.find(
-        {"Taxon": {"$regex": f"^{taxon}$", "$options": "i"}},
-        {"_id": 0}
-    ))
-
-    # Country-specific risk explanation
-    likely_country = prediction.get("likely_poaching_country")
-    specific_profile = next(
-        (f for f in features if f.get("Exporter") == likely_country),
-        None
-    )
-
-    how_text = explain_risk(specific_profile, GLOBAL_MEANS)
-
-    return jsonify({
+    # Country-specific risk explanation, precomputed at startup when available;
+    # computed here for predictions loaded since the last startup, or when the
+    # startup pass was skipped or failed
+    how_text = prediction.pop("risk_explanation_cached", None)
+    if how_text is None:
+        likely_country = prediction.get("likely_poaching_country")
+        # Built in reverse so the first row per exporter wins, as before
+        features_by_exporter = {f.get("Exporter"): f for f in reversed(features)}
+        specific_profile = features_by_exporter.get(likely_country)
+        how_text = explain_risk(specific_profile)
+
+    return {
         "basic_info": prediction,
         "heatmap_data": features,
         "risk_explanation": why_text + how_text
-    })
+    }
+
+# CSV is in the same folder as this file; it is only re-parsed when it changes
+COMPARISON_CSV = "5_Species_Summary.csv"
+_comparison_cache = {"mtime": None, "json": None}
+
+def load_comparison_json():
+    mtime = os.stat(COMPARISON_CSV).st_mtime
+    if _comparison_cache["mtime"] != mtime:
+        df = pd.read_csv(COMPARISON_CSV)
+        _comparison_cache["json"] = df.to_json(orient="records")
+        _comparison_cache["mtime"] = mtime
+    return _comparison_cache["json"]
+
+# Without the means every threshold is 0, so nothing is written back to the
+# shared collection rather than overwriting good text with wrong text
+try:
+    if GLOBAL_MEANS:
+        updated = cache_risk_explanations()
+        print(f"✅ Updated risk explanations on {updated} prediction documents.")
+    else:
+        print("⚠️ Skipping risk explanation caching: global means unavailable.")
+except Exception as e:
+    print(f"❌ Risk explanation caching error: {e}")
+
+# --- 6. API ROUTES ---
+
+@app.route("/get_animal_data", methods=["GET"])
+def get_animal_data():
+    taxon = request.args.get("taxon")
+    if not taxon:
+        return jsonify({"error": "No taxon provided"}), 400
+    if not TAXON_PATTERN.fullmatch(taxon):
+        return jsonify({"error": "Invalid taxon"}), 400
+
+    data = load_animal_data(_normalize_taxon(taxon))
+    if not data:
+        return jsonify({"error": "Species not found"}), 404
+
+    return jsonify(data)
 
 @app.route("/get_species_facts", methods=["GET"])
 def get_species_facts():
     taxon = request.args.get("taxon")
     if not taxon:
         return jsonify({"error": "No taxon provided"}), 400
+    if not TAXON_PATTERN.fullmatch(taxon):
+        return jsonify({"error": "Invalid taxon"}), 400
 
-    facts = SPECIES_FACTS.get(taxon.strip().lower())
+    facts = SPECIES_FACTS.get(_normalize_taxon(taxon))
     if not facts:
         return jsonify({"error": "Species facts not found"}), 404
 
@@ -174,14 +341,14 @@ def get_species_facts():
 @app.route("/get_comparison_data", methods=["GET"])
 def get_comparison_data():
     try:
-        # CSV is in the same folder as this file
-        df = pd.read_csv("5_Species_Summary.csv")
-        return jsonify(df.to_dict(orient="records"))
+        return Response(load_comparison_json(), mimetype="application/json")
     except FileNotFoundError:
         return jsonify({"error": "Comparison data CSV missing."}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# --- 6. RUN SERVER ---
+# --- 7. RUN SERVER ---
+# Development only; in production serve through gunicorn (see gunicorn.conf.py):
+#   gunicorn app:app
 if __name__ == "__main__":
-    app.run(debug=True, use_reloader=False, host="0.0.0.0", port=5000)
+    app.run(debug=False, use_reloader=False, host="0.0.0.0", port=5000)
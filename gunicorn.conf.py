@@ -0,0 +1,29 @@
+# Production server settings, picked up by `gunicorn app:app`.
+# This file only supports the gevent worker: the patch below runs whenever the
+# config is imported, so do not override worker_class (e.g. `-k sync`); pass
+# `-c /dev/null` to run another worker class without it.
+# Patch before app.py imports pymongo so its sockets cooperate with gevent.
+from gevent import monkey
+monkey.patch_all()
+
+bind = "0.0.0.0:5000"
+worker_class = "gevent"
+workers = 4
+worker_connections = 100
+
+# Import app.py once in the master so the startup Mongo work (backfill, indexes,
+# means, cached explanations) runs once and workers inherit it copy-on-write.
+preload_app = True
+
+def when_ready(server):
+    # The master serves no requests; a closed client can't be reused, so
+    # workers build their own in post_fork instead of sharing it across fork.
+    import app
+    app.client.close()
+
+def post_fork(server, worker):
+    import app
+    app.client = app.create_client()
+    app.db = app.client["wildlife_db"]
+    # Warm the worker's pool before traffic arrives
+    app.db.features.find_one({}, {"_id": 1})
@@ -3,36 +3,35 @@ import pandas as pd
 # ---------------------------
 # Load precomputed data
 # ---------------------------
-final_output = pd.read_csv("Final_Output.csv")
-feature_df = pd.read_csv("Feature_Matrix.csv")
+final_output = pd.read_csv("Final_Output.csv", engine="pyarrow")
+feature_df = pd.read_csv("Feature_Matrix.csv", engine="pyarrow")
+
+# Means are fixed for the dataset, and the (Taxon, Exporter) index turns each
+# profile lookup into an index seek instead of a full-column mask
+MEANS = feature_df.mean(numeric_only=True).to_dict()
+feature_df = feature_df.set_index(['Taxon', 'Exporter']).sort_index()
 
 # ---------------------------
 # Helper: explain risk
 # ---------------------------
 def explain_risk(taxon, country):
-    profile = feature_df[
-        (feature_df['Taxon'] == taxon) &
-        (feature_df['Exporter'] == country)
-    ]
-
-    if profile.empty:
+    try:
+        profile = feature_df.loc[[(taxon, country)]].iloc[0]
+    except KeyError:
         return "No detailed trade profile available."
 
-    profile = profile.iloc[0]
-    means = feature_df.mean(numeric_only=True)
-
     reasons = []
 
-    if profile['export_qty_log'] > means['export_qty_log']:
+    if profile['export_qty_log'] > MEANS['export_qty_log']:
         reasons.append("higher-than-average export volume")
 
-    if profile['num_trade_events'] > means['num_trade_events']:
+    if profile['num_trade_events'] > MEANS['num_trade_events']:
         reasons.append("frequent export transactions")
 
-    if profile['source_risk'] > means['source_risk']:
+    if profile['source_risk'] > MEANS['source_risk']:
         reasons.append("predominantly wild-sourced specimens")
 
-    if profile['live_trade_ratio'] > means['live_trade_ratio']:
+    if profile['live_trade_ratio'] > MEANS['live_trade_ratio']:
         reasons.append("significant live animal trade")
 
     if profile['appendix_risk'] >= 2: